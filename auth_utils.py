@@ -4,36 +4,81 @@ Handles RSA signature generation and bearer token retrieval
 """
 
 from typing import Any, Dict
+from functools import lru_cache
 import base64
+import logging
+import re
+import threading
 import time
-import requests
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.backends import default_backend
 
+from http_utils import session
+
+logger = logging.getLogger(__name__)
+
+# Environment -> base URL maps, resolved once at import. Tools share these
+# instead of rebuilding the ternary on every invocation.
+PG_BASE_URLS = {
+    "production": "https://api.cashfree.com/pg",
+    "sandbox": "https://sandbox.cashfree.com/pg"
+}
+PAYOUT_BASE_URLS = {
+    "production": "https://payout-api.cashfree.com",
+    "sandbox": "https://payout-gamma.cashfree.com"
+}
+
+# Cache bearer tokens per (client_id, environment) so repeated tool invocations
+# don't redo the RSA signature + authorize round-trip on every call.
+# TTL is conservative compared to Cashfree's typical token lifetime.
+_TOKEN_TTL = 300
+_TOKEN_CACHE: Dict[tuple, tuple] = {}
+_TOKEN_LOCK = threading.Lock()
+
+# Single-pass cleanup tables for parse_public_key
+_WS_STRIP = str.maketrans('', '', '\t\n\r ')
+_PEM_HEADER_RE = re.compile(r'-----(?:BEGIN|END) PUBLIC KEY-----')
+
+# Signatures encrypt f"{client_id}.{epoch_seconds}", so two calls within the
+# same second produce the same plaintext; reuse the ciphertext instead of
+# paying for another RSA-OAEP encrypt. Maps client_id -> (epoch, signature).
+_SIG_CACHE: Dict[str, tuple] = {}
+_SIG_LOCK = threading.Lock()
+
+# OAEP config is an immutable value object; build it once instead of per
+# signature (equivalent to Java's RSA/ECB/OAEPWithSHA-1AndMGF1Padding)
+_OAEP_PADDING = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA1()),
+    algorithm=hashes.SHA1(),
+    label=None
+)
+
+
+@lru_cache(maxsize=8)
+def _parse_public_key_cached(cleaned_key: str):
+    """Decode and DER-parse a cleaned base64 key, caching the result.
+
+    The key is constant per credential set, so the base64 decode and
+    ASN.1/DER parse only need to run once. The returned key object is
+    immutable and safe to share across threads.
+    """
+    # Decode base64 to get raw key bytes
+    key_bytes = base64.b64decode(cleaned_key)
+
+    # Parse the public key using DER format (equivalent to X509EncodedKeySpec in Java)
+    return serialization.load_der_public_key(key_bytes, backend=default_backend())
+
 
 def parse_public_key(public_key_content: str):
     """Parse and validate the RSA public key"""
     try:
-        # Clean the public key content following Java implementation
-        cleaned_key = public_key_content.strip()
-        
-        # Remove tabs, newlines, and carriage returns
-        cleaned_key = cleaned_key.replace('\t', '').replace('\n', '').replace('\r', '')
-        
-        # Remove PEM headers and footers
-        cleaned_key = cleaned_key.replace("-----BEGIN PUBLIC KEY-----", "").replace("-----END PUBLIC KEY-----", "")
-        
-        # Remove any remaining whitespace
-        cleaned_key = cleaned_key.strip()
-        
-        # Decode base64 to get raw key bytes
-        key_bytes = base64.b64decode(cleaned_key)
-        
-        # Parse the public key using DER format (equivalent to X509EncodedKeySpec in Java)
-        public_key = serialization.load_der_public_key(key_bytes, backend=default_backend())
-        
-        return public_key
+        # Clean the public key content following Java implementation:
+        # strip PEM headers/footers, then drop all whitespace in one pass
+        cleaned_key = _PEM_HEADER_RE.sub('', public_key_content)
+        cleaned_key = cleaned_key.translate(_WS_STRIP)
+
+        return _parse_public_key_cached(cleaned_key)
     except Exception as e:
         raise ValueError(f"Failed to parse public key: {str(e)}")
 
@@ -44,31 +89,34 @@ def generate_signature(client_id: str, public_key_content: str) -> str:
         # Create client_id with epoch timestamp
         epoch_timestamp = int(time.time())
         client_id_with_timestamp = f"{client_id}.{epoch_timestamp}"
-        
-        print(f"[DEBUG] Signature generation:")
-        print(f"[DEBUG] Client ID: {client_id}")
-        print(f"[DEBUG] Timestamp: {epoch_timestamp}")
-        print(f"[DEBUG] Data to encrypt: {client_id_with_timestamp}")
-        
+
+        # Reuse the signature for identical plaintext (same second, same client)
+        with _SIG_LOCK:
+            cached = _SIG_CACHE.get(client_id)
+            if cached and cached[0] == epoch_timestamp:
+                return cached[1]
+
+
+        logger.debug("Generating signature for client %s at %s", client_id, epoch_timestamp)
+
+
         # Parse the public key
         public_key = parse_public_key(public_key_content)
         
-        # Encrypt using RSA/OAEP padding (equivalent to Java's RSA/ECB/OAEPWithSHA-1AndMGF1Padding)
+        # Encrypt using the shared RSA/OAEP padding config
         encrypted_data = public_key.encrypt(
             client_id_with_timestamp.encode('utf-8'),
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA1()),
-                algorithm=hashes.SHA1(),
-                label=None
-            )
+            _OAEP_PADDING
         )
         
         # Encode to base64
         encrypted_signature = base64.b64encode(encrypted_data).decode('utf-8')
-        
-        print(f"[DEBUG] Generated signature length: {len(encrypted_signature)}")
-        print(f"[DEBUG] Generated signature: {encrypted_signature}")
-        
+
+        logger.debug("Generated signature of length %s", len(encrypted_signature))
+
+        with _SIG_LOCK:
+            _SIG_CACHE[client_id] = (epoch_timestamp, encrypted_signature)
+
         return encrypted_signature
         
     except Exception as e:
@@ -82,19 +130,24 @@ def get_bearer_token(credentials: dict[str, Any]) -> str:
         client_id = credentials.get("cashfree_client_id")
         client_secret = credentials.get("cashfree_client_secret")
         public_key = credentials.get("cashfree_public_key")
-        
+
+        # Return a cached token if it is still fresh
+        cache_key = (client_id, environment)
+        with _TOKEN_LOCK:
+            cached = _TOKEN_CACHE.get(cache_key)
+            if cached and time.time() - cached[1] < _TOKEN_TTL:
+                return cached[0]
+
         # Generate signature
         signature = generate_signature(client_id, public_key)
         
         # Determine API URL based on environment
-        if environment == "production":
-            api_url = "https://payout-api.cashfree.com/payout/v1/authorize"
-        else:
-            api_url = "https://payout-gamma.cashfree.com/payout/v1/authorize"
-        
-        print(f"[DEBUG] Bearer token request URL: {api_url}")
-        print(f"[DEBUG] Generated signature: {signature}")
-        
+        payout_base = PAYOUT_BASE_URLS.get(environment, PAYOUT_BASE_URLS["sandbox"])
+        api_url = f"{payout_base}/payout/v1/authorize"
+
+
+        logger.debug("Bearer token request URL: %s", api_url)
+
         # Prepare headers
         headers = {
             "Content-Type": "application/json",
@@ -103,33 +156,39 @@ def get_bearer_token(credentials: dict[str, Any]) -> str:
             "X-Cf-Signature": signature
         }
         
-        print(f"[DEBUG] Request headers: {headers}")
-        
-        # Make the authorize request
-        response = requests.post(api_url, headers=headers, json={}, timeout=30)
-        
-        print(f"[DEBUG] Response status: {response.status_code}")
-        print(f"[DEBUG] Response body: {response.text}")
-        
+        # Make the authorize request (never log the headers - they carry the client secret)
+        response = session.post(api_url, headers=headers, json={}, timeout=30)
+
+        logger.debug("Authorize response status: %s", response.status_code)
+
         if response.status_code == 200:
             response_data = response.json()
             bearer_token = response_data.get("data", {}).get("token")
             if bearer_token:
-                print(f"[DEBUG] Successfully obtained bearer token: {bearer_token[:20]}...")
+                logger.debug("Successfully obtained bearer token")
+                with _TOKEN_LOCK:
+                    _TOKEN_CACHE[cache_key] = (bearer_token, time.time())
                 return bearer_token
             else:
                 raise Exception(f"Bearer token not found in response. Response structure: {response_data}")
         else:
             error_msg = f"Failed to get bearer token. Status: {response.status_code}"
-            try:
-                error_data = response.json()
+            # Only pay for a JSON parse when the server says it sent JSON;
+            # gateway/WAF errors often come back as HTML
+            error_data = None
+            if "json" in response.headers.get("Content-Type", ""):
+                try:
+                    error_data = response.json()
+                except ValueError:
+                    error_data = None
+            if error_data is not None:
                 error_msg += f", Message: {error_data.get('message', 'Unknown error')}"
                 # Add more details for debugging
                 if 'subCode' in error_data:
                     error_msg += f", SubCode: {error_data['subCode']}"
                 if 'status' in error_data:
                     error_msg += f", Status: {error_data['status']}"
-            except:
+            else:
                 error_msg += f", Response: {response.text}"
             raise Exception(error_msg)
             
@@ -137,28 +196,61 @@ def get_bearer_token(credentials: dict[str, Any]) -> str:
         raise Exception(f"Bearer token retrieval failed: {str(e)}")
 
 
+@lru_cache(maxsize=8)
+def _pg_auth_cached(environment: str, api_version: str, client_id: str, client_secret: str) -> tuple:
+    """Build the (base_url, header items) pair for a credential set once"""
+    base_url = PG_BASE_URLS.get(environment, PG_BASE_URLS["sandbox"])
+    header_items = (
+        ("Content-Type", "application/json"),
+        ("X-Api-Version", api_version),
+        ("X-Client-Id", client_id),
+        ("X-Client-Secret", client_secret),
+        ("Accept", "application/json")
+    )
+    return base_url, header_items
+
+
+def resolve_pg_auth(credentials: dict[str, Any]) -> tuple:
+    """Resolve (base_url, headers) for a Payments API call.
+
+    Cached on the credential values themselves, so repeated invocations with
+    unchanged credentials skip the per-call header assembly; callers get a
+    fresh dict they may mutate. Payments API calls always authenticate with
+    client credentials, even when the public_key method is configured.
+    """
+    base_url, header_items = _pg_auth_cached(
+        credentials.get("cashfree_environment", "sandbox"),
+        credentials.get("cashfree_api_version", "2025-01-01"),
+        credentials.get("cashfree_client_id"),
+        credentials.get("cashfree_client_secret")
+    )
+    return base_url, dict(header_items)
+
+
 def get_auth_headers(credentials: dict[str, Any], include_api_version: bool = True, is_payout_api: bool = False) -> Dict[str, str]:
     """Get authentication headers based on the configured auth method"""
     auth_method = credentials.get("auth_method", "client_credentials")
-    headers = {"Content-Type": "application/json"}
-    
-    # Add API version if requested (only for Payments API, not Payout API)
+
+    if auth_method == "public_key" and is_payout_api:
+        # Bearer token is only used for payout/cashgram operations; the
+        # Payout API does not take X-Api-Version
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {get_bearer_token(credentials)}"
+        }
+
+    # Client credentials for everything else (regular payment operations use
+    # them even when the public_key method is configured)
     if include_api_version and not is_payout_api:
-        api_version = credentials.get("cashfree_api_version", "2025-01-01")
-        headers["X-Api-Version"] = api_version
-    
-    if auth_method == "client_credentials":
-        headers["X-Client-Id"] = credentials["cashfree_client_id"]
-        headers["X-Client-Secret"] = credentials["cashfree_client_secret"]
-    elif auth_method == "public_key":
-        # For public key auth, only use bearer token for payout/cashgram operations
-        if is_payout_api:
-            # Get bearer token for payout operations (cashgram)
-            bearer_token = get_bearer_token(credentials)
-            headers["Authorization"] = f"Bearer {bearer_token}"
-        else:
-            # For regular payment operations, use client credentials even with public_key method
-            headers["X-Client-Id"] = credentials["cashfree_client_id"]
-            headers["X-Client-Secret"] = credentials["cashfree_client_secret"]
-    
-    return headers
+        return {
+            "Content-Type": "application/json",
+            "X-Api-Version": credentials.get("cashfree_api_version", "2025-01-01"),
+            "X-Client-Id": credentials["cashfree_client_id"],
+            "X-Client-Secret": credentials["cashfree_client_secret"]
+        }
+
+    return {
+        "Content-Type": "application/json",
+        "X-Client-Id": credentials["cashfree_client_id"],
+        "X-Client-Secret": credentials["cashfree_client_secret"]
+    }
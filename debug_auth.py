@@ -27,22 +27,18 @@ def test_complete_auth_flow():
         print("Client Secret is required!")
         return
     
+    environment = input("Enter environment (sandbox/production) [sandbox]: ").strip() or "sandbox"
+
+    # Read the key in one bulk read instead of a per-line input() loop; PEM
+    # bodies can legitimately contain blank lines, which the old loop treated
+    # as the end of input. Asked last because the read runs until EOF.
     print("\nEnter your Public Key (paste the entire key including headers):")
-    print("Paste your key and press Enter twice when done:")
-    public_key_lines = []
-    while True:
-        line = input()
-        if line.strip() == "" and public_key_lines:
-            break
-        public_key_lines.append(line)
-    
-    public_key = "\n".join(public_key_lines)
-    if not public_key.strip():
+    print("Paste your key, then press Ctrl-D (Unix) or Ctrl-Z + Enter (Windows):")
+    public_key = sys.stdin.read().strip()
+    if not public_key:
         print("Public Key is required!")
         return
     
-    environment = input("Enter environment (sandbox/production) [sandbox]: ").strip() or "sandbox"
-    
     # Test credentials
     test_credentials = {
         "auth_method": "public_key",
@@ -91,7 +87,9 @@ def test_complete_auth_flow():
         try:
             headers = get_auth_headers(test_credentials, include_api_version=False, is_payout_api=True)
             print("✓ Auth headers generated successfully")
-            print(f"Final headers: {headers}")
+            # Don't echo the bearer token itself to the terminal
+            redacted = {key: ("Bearer ***" if key == "Authorization" else value) for key, value in headers.items()}
+            print(f"Final headers: {redacted}")
         except Exception as e:
             print(f"✗ Auth headers generation failed: {e}")
             return
@@ -128,25 +126,33 @@ INVALID_KEY_DATA_FOR_TESTING
     except ImportError as e:
         print(f"Import error: {e}")
 
+def _run_complete_test():
+    """Confirm before making real API calls, then run the full flow"""
+    print("\n⚠️  WARNING: This will make real API calls to Cashfree!")
+    print("Only proceed if you want to test with real credentials.")
+    confirm = input("Continue? (y/N): ").strip().lower()
+    if confirm in ['y', 'yes']:
+        test_complete_auth_flow()
+    else:
+        print("Test cancelled.")
+
+# Menu choices dispatch through a table instead of an if/elif chain
+_MENU = {
+    "1": _run_complete_test,
+    "2": test_with_dummy_data,
+    "3": lambda: print("Goodbye!")
+}
+
 if __name__ == "__main__":
     print("Choose test mode:")
     print("1. Complete authentication test (requires real credentials)")
     print("2. Basic functionality test (uses dummy data)")
     print("3. Exit")
-    
+
     choice = input("\nEnter choice (1-3): ").strip()
-    
-    if choice == "1":
-        print("\n⚠️  WARNING: This will make real API calls to Cashfree!")
-        print("Only proceed if you want to test with real credentials.")
-        confirm = input("Continue? (y/N): ").strip().lower()
-        if confirm in ['y', 'yes']:
-            test_complete_auth_flow()
-        else:
-            print("Test cancelled.")
-    elif choice == "2":
-        test_with_dummy_data()
-    elif choice == "3":
-        print("Goodbye!")
+
+    action = _MENU.get(choice)
+    if action:
+        action()
     else:
         print("Invalid choice")
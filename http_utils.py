@@ -0,0 +1,30 @@
+"""
+Shared HTTP session for Cashfree Payments Plugin
+Reuses pooled HTTPS connections across tool invocations to avoid a fresh
+TLS handshake on every API call
+"""
+
+import atexit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# One session for the whole plugin process. requests.Session is thread-safe
+# for concurrent requests, and pooling keeps connections to
+# api.cashfree.com / payout-api.cashfree.com warm between calls.
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504],
+    ),
+)
+
+session = requests.Session()
+session.mount("https://", _adapter)
+
+# Close pooled sockets cleanly when the plugin process exits
+atexit.register(session.close)
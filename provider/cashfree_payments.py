@@ -2,11 +2,19 @@ from typing import Any
 
 from dify_plugin import ToolProvider
 from dify_plugin.errors.tool import ToolProviderCredentialValidationError
-from auth_utils import parse_public_key
+
+_VALID_ENVIRONMENTS = frozenset(("sandbox", "production"))
+
+# auth_method -> (human-readable label, required credential fields, needs key
+# parse). Built once at import so validation doesn't rebuild lists per call.
+_AUTH_SCHEMES = {
+    "client_credentials": ("client credentials", ("cashfree_client_id", "cashfree_client_secret"), False),
+    "public_key": ("public key signature", ("cashfree_client_id", "cashfree_client_secret", "cashfree_public_key"), True)
+}
 
 
 class CashfreePaymentsProvider(ToolProvider):
-    
+
     def _validate_credentials(self, credentials: dict[str, Any]) -> None:
         """
         Validate credentials for Cashfree Payments
@@ -15,41 +23,46 @@ class CashfreePaymentsProvider(ToolProvider):
         2. Public Key Signature (client_id + client_secret + public_key)
         """
         # Environment validation (required for both auth methods)
-        if not credentials.get("cashfree_environment"):
+        environment = credentials.get("cashfree_environment")
+        if not environment:
             raise ToolProviderCredentialValidationError("Missing required field: cashfree_environment")
-        
-        if credentials.get("cashfree_environment") not in ["sandbox", "production"]:
+
+        if environment not in _VALID_ENVIRONMENTS:
             raise ToolProviderCredentialValidationError("Environment must be 'sandbox' or 'production'")
-        
-        # Get the authentication method
+
+        # Dispatch on the authentication method
         auth_method = credentials.get("auth_method", "client_credentials")
-        
-        if auth_method == "client_credentials":
-            # Validate client credentials
-            required_fields = ["cashfree_client_id", "cashfree_client_secret"]
-            
-            for field in required_fields:
-                if not credentials.get(field):
-                    raise ToolProviderCredentialValidationError(f"Missing required field for client credentials: {field}")
-                    
-        elif auth_method == "public_key":
-            # Validate public key signature requirements
-            required_fields = ["cashfree_client_id", "cashfree_client_secret", "cashfree_public_key"]
-            
-            for field in required_fields:
-                if not credentials.get(field):
-                    raise ToolProviderCredentialValidationError(f"Missing required field for public key signature: {field}")
-            
-            # Validate public key format using updated parser
+        scheme = _AUTH_SCHEMES.get(auth_method)
+        if scheme is None:
+            raise ToolProviderCredentialValidationError("Invalid authentication method. Must be 'client_credentials' or 'public_key'")
+
+        label, required_fields, needs_key_parse = scheme
+        # Single pass over the field tuple; reporting every missing field at
+        # once saves the user a fix-one-rerun loop
+        missing_fields = [field for field in required_fields if not credentials.get(field)]
+        if missing_fields:
+            raise ToolProviderCredentialValidationError(f"Missing required fields for {label}: {', '.join(missing_fields)}")
+
+        if needs_key_parse:
+            # Cheap structural check first: reject keys missing the PEM
+            # markers (the common paste error) before paying for the full
+            # ASN.1 parse
+            public_key_content = credentials.get("cashfree_public_key")
+            pem = public_key_content.strip()
+            if not (pem.startswith("-----BEGIN PUBLIC KEY-----") and pem.endswith("-----END PUBLIC KEY-----")):
+                raise ToolProviderCredentialValidationError("Invalid public key format: missing PEM markers")
+
+            # Validate public key format using updated parser. Imported here
+            # so validating client credentials never pays for the transitive
+            # cryptography import; after the first call this is a cached
+            # sys.modules lookup
+            from auth_utils import parse_public_key
+
             try:
-                public_key_content = credentials.get("cashfree_public_key")
                 parse_public_key(public_key_content)
             except Exception as e:
                 raise ToolProviderCredentialValidationError(f"Invalid public key format: {str(e)}")
-                
-        else:
-            raise ToolProviderCredentialValidationError("Invalid authentication method. Must be 'client_credentials' or 'public_key'")
-        
+
         # All validations passed
 
 
@@ -0,0 +1,45 @@
+"""
+Shared base class for Cashfree Payments tools
+Centralizes the credential checks and request plumbing that were duplicated
+across the per-endpoint tool modules
+"""
+
+from typing import Any, Optional
+import uuid
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from auth_utils import resolve_pg_auth
+
+# Re-exported so tool modules only touch dify_plugin through this module
+__all__ = ["CashfreeToolBase", "ToolInvokeMessage"]
+
+
+class CashfreeToolBase(Tool):
+    """Common helpers for tools calling the Cashfree APIs"""
+
+    @staticmethod
+    def check_credentials(credentials: dict[str, Any]) -> Optional[str]:
+        """Return an error message if the configured auth method is missing
+        required fields, else None"""
+        auth_method = credentials.get("auth_method", "client_credentials")
+
+        if auth_method == "client_credentials":
+            if not (credentials.get("cashfree_client_id") and credentials.get("cashfree_client_secret")):
+                return "Fatal Error: Cashfree client credentials (Client ID/Secret) are missing."
+        elif auth_method == "public_key":
+            required_fields = ["cashfree_client_id", "cashfree_client_secret", "cashfree_public_key"]
+            missing_fields = [field for field in required_fields if not credentials.get(field)]
+            if missing_fields:
+                return f"Fatal Error: Missing required fields for public key auth: {', '.join(missing_fields)}"
+        return None
+
+    @staticmethod
+    def pg_request_context(credentials: dict[str, Any], with_request_id: bool = True) -> tuple:
+        """Resolve (base_url, headers) for a Payments API call, minting a
+        fresh x-request-id unless told otherwise"""
+        base_url, headers = resolve_pg_auth(credentials)
+        if with_request_id:
+            headers["x-request-id"] = uuid.uuid4().hex
+        return base_url, headers
@@ -1,26 +1,44 @@
 import requests
-import json
-import uuid
-import re
+import orjson
+import string
 from collections.abc import Generator
 from typing import Any, Dict
 
-from dify_plugin import Tool
-from dify_plugin.entities.tool import ToolInvokeMessage
-from auth_utils import get_auth_headers
+from tool_base import CashfreeToolBase, ToolInvokeMessage
+from http_utils import session
 
-class CancelPaymentLinkTool(Tool):
+# link_id allows alphanumerics, '_' and '-'; set difference against a
+# frozenset runs in C without the regex engine
+_LINK_ID_ALLOWED = frozenset(string.ascii_letters + string.digits + '_-')
+
+# 400-level cancellation failures mapped to clearer messages; scanned once
+# against the lowercased API message
+_CANCEL_400_HINTS = (
+    ("already cancelled", "Payment link '{link_id}' is already cancelled"),
+    ("expired", "Payment link '{link_id}' has expired and cannot be cancelled"),
+    ("not found", "Payment link '{link_id}' not found")
+)
+
+# Baseline response structure, copied per invocation
+_RESPONSE_TEMPLATE = {
+    "status_code": None,
+    "success": False,
+    "api_response": None,
+    "message": "",
+    "link_id": None,
+    "link_status": None
+}
+
+class CancelPaymentLinkTool(CashfreeToolBase):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # Single yield site; _build exits early with plain returns, which are
+        # cheaper than extra generator suspensions
+        yield self.create_json_message(self._build(tool_parameters))
+
+    def _build(self, tool_parameters: dict[str, Any]) -> Dict[str, Any]:
         
         # Initialize a consistent response structure
-        response_data: Dict[str, Any] = {
-            "status_code": None,
-            "success": False,
-            "api_response": None,
-            "message": "",
-            "link_id": None,
-            "link_status": None
-        }
+        response_data: Dict[str, Any] = _RESPONSE_TEMPLATE.copy()
 
         # --- 1. Retrieve & Validate Required Inputs ---
         link_id = tool_parameters.get("link_id")
@@ -28,89 +46,77 @@ class CancelPaymentLinkTool(Tool):
         # Validate required parameters
         if not link_id:
             response_data["message"] = "Fatal Error: link_id is required"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # Validate link_id format
         if not (1 <= len(link_id) <= 50):
             response_data["message"] = "Fatal Error: link_id must be between 1 and 50 characters"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
         
-        if not re.match(r'^[a-zA-Z0-9_-]+$', link_id):
+        if set(link_id) - _LINK_ID_ALLOWED:
             response_data["message"] = "Fatal Error: link_id can only contain alphanumeric characters, '_' and '-'"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # --- 2. Retrieve Credentials ---
         try:
             credentials = self.runtime.credentials
-            environment = credentials.get("cashfree_environment", "sandbox")
-            auth_method = credentials.get("auth_method", "client_credentials")
-            
-            # Validate that we have the required credentials for the selected auth method
-            if auth_method == "client_credentials":
-                if not (credentials.get("cashfree_client_id") and credentials.get("cashfree_client_secret")):
-                    response_data["message"] = "Fatal Error: Cashfree client credentials (Client ID/Secret) are missing."
-                    yield self.create_json_message(response_data)
-                    return
-            elif auth_method == "public_key":
-                required_fields = ["cashfree_client_id", "cashfree_client_secret", "cashfree_public_key"]
-                missing_fields = [field for field in required_fields if not credentials.get(field)]
-                if missing_fields:
-                    response_data["message"] = f"Fatal Error: Missing required fields for public key auth: {', '.join(missing_fields)}"
-                    yield self.create_json_message(response_data)
-                    return
-                    
+            credential_error = self.check_credentials(credentials)
+            if credential_error:
+                response_data["message"] = credential_error
+                return response_data
         except Exception as e:
             response_data["message"] = f"Fatal Error: Failed to retrieve credentials: {str(e)}"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # --- 3. Construct API URL and Headers ---
-        base_url = "https://api.cashfree.com/pg" if environment == "production" else "https://sandbox.cashfree.com/pg"
-        api_url = f"{base_url}/links/{link_id}/cancel"
-        
-        # Get authentication headers from provider
+        # pg_request_context caches the base URL and header template per
+        # credential set; only the request id is minted per call
         try:
-            headers = get_auth_headers(credentials, include_api_version=True, is_payout_api=False)
-            headers["Accept"] = "application/json"
-            headers["x-request-id"] = str(uuid.uuid4())
+            base_url, headers = self.pg_request_context(credentials)
         except Exception as e:
             response_data["message"] = f"Fatal Error: Authentication failed: {str(e)}"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
+
+        api_url = f"{base_url}/links/{link_id}/cancel"
 
         # --- 4. Execute API Call (POST request) ---
         try:
-            response = requests.post(api_url, headers=headers, timeout=30)
+            response = session.post(api_url, headers=headers, timeout=30)
             
             # Update base status information
             response_data["status_code"] = response.status_code
             response_data["success"] = (response.status_code == 200)
 
+            # Empty bodies (204s, some gateway errors) skip the JSON parse
+            # rather than paying for the decode-exception path
+            if not response.content:
+                response_data["message"] = f"API returned status {response.status_code} with no body"
+                return response_data
+
             # Attempt to parse JSON body
             try:
-                raw_api_data = response.json()
+                raw_api_data = orjson.loads(response.content)
                 response_data["api_response"] = raw_api_data
                 
                 if response_data["success"]:
-                    # Extract key information for success response
-                    response_data["link_id"] = raw_api_data.get("link_id")
-                    response_data["link_status"] = raw_api_data.get("link_status")
-                    response_data["message"] = f"Payment link cancelled successfully. Link ID: {response_data['link_id']}, Status: {response_data['link_status']}"
+                    # Extract key information once into locals, reused in the
+                    # message instead of re-read from the response dict
+                    cancelled_id = raw_api_data.get("link_id")
+                    link_status = raw_api_data.get("link_status")
+                    response_data.update(link_id=cancelled_id, link_status=link_status)
+                    response_data["message"] = f"Payment link cancelled successfully. Link ID: {cancelled_id}, Status: {link_status}"
                 else:
                     # Handle specific error cases
                     error_message = raw_api_data.get('message', f"API returned error status {response.status_code}")
                     
-                    # Check for common cancellation errors
+                    # Check for common cancellation errors; lowercase once
+                    # and walk the hint table at most once
                     if response.status_code == 400:
-                        if "already cancelled" in error_message.lower():
-                            response_data["message"] = f"Payment link '{link_id}' is already cancelled"
-                        elif "expired" in error_message.lower():
-                            response_data["message"] = f"Payment link '{link_id}' has expired and cannot be cancelled"
-                        elif "not found" in error_message.lower():
-                            response_data["message"] = f"Payment link '{link_id}' not found"
+                        err_lower = error_message.lower()
+                        for needle, template in _CANCEL_400_HINTS:
+                            if needle in err_lower:
+                                response_data["message"] = template.format(link_id=link_id)
+                                break
                         else:
                             response_data["message"] = f"Cannot cancel payment link: {error_message}"
                     elif response.status_code == 404:
@@ -120,13 +126,12 @@ class CancelPaymentLinkTool(Tool):
                     else:
                         response_data["message"] = error_message
 
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 # Handle cases where the server returns a non-JSON body
                 response_data["api_response"] = {"raw_text": response.text}
                 response_data["message"] = f"API returned non-JSON response with status code {response.status_code}."
             
-            # 5. Yield the final, standardized JSON message
-            yield self.create_json_message(response_data)
+            return response_data
 
         except requests.exceptions.RequestException as e:
             # Handle connection or timeout errors
@@ -134,4 +139,4 @@ class CancelPaymentLinkTool(Tool):
             response_data["success"] = False
             response_data["message"] = f"Network Error: Could not connect to API within timeout. Details: {str(e)}"
             
-            yield self.create_json_message(response_data)
+            return response_data
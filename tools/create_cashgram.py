@@ -1,27 +1,51 @@
 import requests
-import json
-import uuid
+import orjson
 import re
-from datetime import datetime, timedelta
+import string
+from datetime import date, timedelta
 from collections.abc import Generator
 from typing import Any, Dict
 
-from dify_plugin import Tool
-from dify_plugin.entities.tool import ToolInvokeMessage
-from auth_utils import get_auth_headers
-
-class CreateCashgramTool(Tool):
+from tool_base import CashfreeToolBase, ToolInvokeMessage
+from auth_utils import get_auth_headers, PAYOUT_BASE_URLS
+from http_utils import session
+
+# cashgramId allows alphanumerics, '_' and '-'; set difference against a
+# frozenset runs in C without the regex engine
+_CASHGRAM_ID_ALLOWED = frozenset(string.ascii_letters + string.digits + '_-')
+
+# Validation patterns compiled once at import instead of per invocation
+_PHONE_RE = re.compile(r'^[\d\+\-\(\)\s]+$')
+_EMAIL_RE = re.compile(r'^[^@]+@[^@]+\.[^@]+$')
+
+# 400-level creation failures mapped to clearer messages; scanned once
+# against the lowercased API message
+_CASHGRAM_400_HINTS = (
+    ("duplicate", "Cashgram with ID '{cashgram_id}' already exists"),
+    ("invalid amount", "Invalid amount specified"),
+    ("invalid date", "Invalid expiry date format or date range")
+)
+
+# Baseline response structure, copied per invocation
+_RESPONSE_TEMPLATE = {
+    "status_code": None,
+    "success": False,
+    "api_response": None,
+    "message": "",
+    "cashgram_id": None,
+    "cashgram_link": None
+}
+
+class CreateCashgramTool(CashfreeToolBase):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # Single yield site; _build exits early with plain returns, which are
+        # cheaper than extra generator suspensions
+        yield self.create_json_message(self._build(tool_parameters))
+
+    def _build(self, tool_parameters: dict[str, Any]) -> Dict[str, Any]:
         
         # Initialize a consistent response structure
-        response_data: Dict[str, Any] = {
-            "status_code": None,
-            "success": False,
-            "api_response": None,
-            "message": "",
-            "cashgram_id": None,
-            "cashgram_link": None
-        }
+        response_data: Dict[str, Any] = _RESPONSE_TEMPLATE.copy()
 
         # --- 1. Retrieve & Validate Required Inputs ---
         cashgram_id = tool_parameters.get("cashgramId")
@@ -30,112 +54,91 @@ class CreateCashgramTool(Tool):
         phone = tool_parameters.get("phone")
         link_expiry = tool_parameters.get("linkExpiry")
 
-        # Validate required parameters
-        required_params = {
-            "cashgramId": cashgram_id,
-            "amount": amount,
-            "name": name,
-            "phone": phone,
-            "linkExpiry": link_expiry
-        }
-
-        missing_params = [key for key, value in required_params.items() if not value]
+        # Validate required parameters over (name, value) pairs directly; no
+        # throwaway dict, and the error still lists every missing parameter
+        missing_params = [
+            param for param, value in (
+                ("cashgramId", cashgram_id),
+                ("amount", amount),
+                ("name", name),
+                ("phone", phone),
+                ("linkExpiry", link_expiry)
+            ) if not value
+        ]
         if missing_params:
             response_data["message"] = f"Fatal Error: Required parameters missing: {', '.join(missing_params)}"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # Validate cashgram_id format
         if not (1 <= len(cashgram_id) <= 35):
             response_data["message"] = "Fatal Error: cashgramId must be between 1 and 35 characters"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
         
-        if not re.match(r'^[a-zA-Z0-9_-]+$', cashgram_id):
+        if set(cashgram_id) - _CASHGRAM_ID_ALLOWED:
             response_data["message"] = "Fatal Error: cashgramId can only contain alphanumeric characters, '_' and '-'"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # Validate amount
         try:
             amount = float(amount)
             if amount < 1.00:
                 response_data["message"] = "Fatal Error: amount must be >= 1.00"
-                yield self.create_json_message(response_data)
-                return
+                return response_data
         except (ValueError, TypeError):
             response_data["message"] = "Fatal Error: amount must be a valid number"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
-        # Validate link expiry date format
+        # Validate link expiry date format. The layout is fixed YYYY/MM/DD,
+        # so slicing to ints skips the strptime format interpreter, and the
+        # comparison is day-granular so date suffices over datetime
         try:
-            expiry_date = datetime.strptime(link_expiry, "%Y/%m/%d")
-            current_date = datetime.now()
-            max_expiry = current_date + timedelta(days=30)
-            
-            if expiry_date <= current_date:
-                response_data["message"] = "Fatal Error: linkExpiry must be a future date"
-                yield self.create_json_message(response_data)
-                return
-                
-            if expiry_date > max_expiry:
-                response_data["message"] = "Fatal Error: linkExpiry cannot be more than 30 days from today"
-                yield self.create_json_message(response_data)
-                return
-                
-        except ValueError:
+            if len(link_expiry) != 10 or link_expiry[4] != '/' or link_expiry[7] != '/':
+                raise ValueError(link_expiry)
+            expiry_date = date(int(link_expiry[0:4]), int(link_expiry[5:7]), int(link_expiry[8:10]))
+        except (TypeError, ValueError):
             response_data["message"] = "Fatal Error: linkExpiry must be in YYYY/MM/DD format"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
+
+        today = date.today()
+        if expiry_date <= today:
+            response_data["message"] = "Fatal Error: linkExpiry must be a future date"
+            return response_data
+
+        if expiry_date > today + timedelta(days=30):
+            response_data["message"] = "Fatal Error: linkExpiry cannot be more than 30 days from today"
+            return response_data
 
         # Validate name length
         if len(name.strip()) == 0:
             response_data["message"] = "Fatal Error: name cannot be empty"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # Validate phone number (basic validation)
-        if not re.match(r'^[\d\+\-\(\)\s]+$', phone):
+        if not _PHONE_RE.match(phone):
             response_data["message"] = "Fatal Error: phone number contains invalid characters"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # Validate email format if provided
         email = tool_parameters.get("email")
-        if email and not re.match(r'^[^@]+@[^@]+\.[^@]+$', email):
+        if email and not _EMAIL_RE.match(email):
             response_data["message"] = "Fatal Error: Invalid email format"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # --- 2. Retrieve Credentials ---
         try:
             credentials = self.runtime.credentials
             environment = credentials.get("cashfree_environment", "sandbox")
-            auth_method = credentials.get("auth_method", "client_credentials")
-            
-            # Validate that we have the required credentials for the selected auth method
-            if auth_method == "client_credentials":
-                if not (credentials.get("cashfree_client_id") and credentials.get("cashfree_client_secret")):
-                    response_data["message"] = "Fatal Error: Cashfree client credentials (Client ID/Secret) are missing."
-                    yield self.create_json_message(response_data)
-                    return
-            elif auth_method == "public_key":
-                required_fields = ["cashfree_client_id", "cashfree_client_secret", "cashfree_public_key"]
-                missing_fields = [field for field in required_fields if not credentials.get(field)]
-                if missing_fields:
-                    response_data["message"] = f"Fatal Error: Missing required fields for public key auth: {', '.join(missing_fields)}"
-                    yield self.create_json_message(response_data)
-                    return
-                    
+            credential_error = self.check_credentials(credentials)
+            if credential_error:
+                response_data["message"] = credential_error
+                return response_data
         except Exception as e:
             response_data["message"] = f"Fatal Error: Failed to retrieve credentials: {str(e)}"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # --- 3. Construct API URL and Headers ---
         # Note: Cashgram uses Payout API, different base URL
-        base_url = "https://payout-api.cashfree.com" if environment == "production" else "https://payout-gamma.cashfree.com"
+        base_url = PAYOUT_BASE_URLS.get(environment, PAYOUT_BASE_URLS["sandbox"])
         api_url = f"{base_url}/payout/v1/createCashgram"
         
         # Get authentication headers from auth utils (excluding x-api-version for cashgram)
@@ -143,8 +146,7 @@ class CreateCashgramTool(Tool):
             headers = get_auth_headers(credentials, include_api_version=False, is_payout_api=True)
         except Exception as e:
             response_data["message"] = f"Fatal Error: Authentication failed: {str(e)}"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # --- 4. Build Request Body ---
         request_body = {
@@ -169,34 +171,42 @@ class CreateCashgramTool(Tool):
 
         # --- 5. Execute API Call (POST request) ---
         try:
-            response = requests.post(api_url, headers=headers, json=request_body, timeout=30)
+            response = session.post(api_url, headers=headers, data=orjson.dumps(request_body), timeout=30)
             
             # Update base status information
             response_data["status_code"] = response.status_code
             response_data["success"] = (response.status_code == 200)
 
+            # Empty bodies (204s, some gateway errors) skip the JSON parse
+            # rather than paying for the decode-exception path
+            if not response.content:
+                response_data["message"] = f"API returned status {response.status_code} with no body"
+                return response_data
+
             # Attempt to parse JSON body
             try:
-                raw_api_data = response.json()
+                raw_api_data = orjson.loads(response.content)
                 response_data["api_response"] = raw_api_data
                 
                 if response_data["success"]:
-                    # Extract key information for success response
-                    response_data["cashgram_id"] = raw_api_data.get("cashgramId")
-                    response_data["cashgram_link"] = raw_api_data.get("link")
-                    response_data["message"] = f"Cashgram created successfully. Cashgram ID: {response_data['cashgram_id']}"
+                    # Extract key information once into locals, reused in the
+                    # message instead of re-read from the response dict
+                    created_id = raw_api_data.get("cashgramId")
+                    cashgram_link = raw_api_data.get("link")
+                    response_data.update(cashgram_id=created_id, cashgram_link=cashgram_link)
+                    response_data["message"] = f"Cashgram created successfully. Cashgram ID: {created_id}"
                 else:
                     # Handle error response
                     error_message = raw_api_data.get('message', f"API returned error status {response.status_code}")
                     
-                    # Check for common Cashgram creation errors
+                    # Check for common Cashgram creation errors; lowercase
+                    # once and walk the hint table at most once
                     if response.status_code == 400:
-                        if "duplicate" in error_message.lower():
-                            response_data["message"] = f"Cashgram with ID '{cashgram_id}' already exists"
-                        elif "invalid amount" in error_message.lower():
-                            response_data["message"] = "Invalid amount specified"
-                        elif "invalid date" in error_message.lower():
-                            response_data["message"] = "Invalid expiry date format or date range"
+                        err_lower = error_message.lower()
+                        for needle, template in _CASHGRAM_400_HINTS:
+                            if needle in err_lower:
+                                response_data["message"] = template.format(cashgram_id=cashgram_id)
+                                break
                         else:
                             response_data["message"] = f"Cannot create Cashgram: {error_message}"
                     elif response.status_code == 401:
@@ -206,13 +216,12 @@ class CreateCashgramTool(Tool):
                     else:
                         response_data["message"] = error_message
 
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 # Handle cases where the server returns a non-JSON body
                 response_data["api_response"] = {"raw_text": response.text}
                 response_data["message"] = f"API returned non-JSON response with status code {response.status_code}."
             
-            # 6. Yield the final, standardized JSON message
-            yield self.create_json_message(response_data)
+            return response_data
 
         except requests.exceptions.RequestException as e:
             # Handle connection or timeout errors
@@ -220,4 +229,4 @@ class CreateCashgramTool(Tool):
             response_data["success"] = False
             response_data["message"] = f"Network Error: Could not connect to API within timeout. Details: {str(e)}"
             
-            yield self.create_json_message(response_data)
+            return response_data
@@ -1,27 +1,64 @@
 import requests
-import json
+import logging
+import orjson
 import uuid
-import re
+import string
 from collections.abc import Generator
 from typing import Any, Dict
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from auth_utils import get_auth_headers
+from auth_utils import get_auth_headers, PG_BASE_URLS
+from http_utils import session
+
+logger = logging.getLogger(__name__)
+
+# Baseline response structure, copied per invocation. create_json_message
+# expects a plain dict, so a flat template + copy is the cheapest option.
+_RESPONSE_TEMPLATE = {
+    "status_code": None,
+    "success": False,
+    "api_response": None,
+    "message": "Tool started successfully",
+    "order_id": None,
+    "payment_session_id": None,
+    "tool_execution": "STARTED"
+}
+
+# order_id charset (alphanumerics, '_' and '-') as a bytes delete-table:
+# bytes.translate returns empty iff every character is allowed
+_ORDER_ID_ALLOWED_BYTES = (string.ascii_letters + string.digits + '_-').encode()
+
+def _valid_order_id(order_id: str) -> bool:
+    """Check order_id length and charset in a single C-level pass"""
+    try:
+        encoded = order_id.encode('ascii')
+    except UnicodeEncodeError:
+        return False
+    return 3 <= len(encoded) <= 45 and not encoded.translate(None, _ORDER_ID_ALLOWED_BYTES)
+
+# Validation rules for optional parameters, checked only when a value was
+# provided: (parameter name, predicate, error message)
+_OPTIONAL_PARAM_RULES = (
+    ("order_id",
+     _valid_order_id,
+     "Fatal Error: order_id must be between 3 and 45 characters and can only contain alphanumeric characters, '_' and '-'"),
+    ("order_note",
+     lambda v: 3 <= len(v) <= 200,
+     "Fatal Error: order_note must be between 3 and 200 characters"),
+    ("return_url",
+     lambda v: len(v) <= 250,
+     "Fatal Error: return_url must not exceed 250 characters"),
+    ("notify_url",
+     lambda v: len(v) <= 250 and v.startswith('https://'),
+     "Fatal Error: notify_url must use HTTPS protocol and not exceed 250 characters"),
+)
 
 class CreateOrderTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         
         # Initialize a consistent response structure
-        response_data: Dict[str, Any] = {
-            "status_code": None,
-            "success": False,
-            "api_response": None,
-            "message": "Tool started successfully",
-            "order_id": None,
-            "payment_session_id": None,
-            "tool_execution": "STARTED"
-        }
+        response_data: Dict[str, Any] = _RESPONSE_TEMPLATE.copy()
 
         try:
             # --- 1. Retrieve & Validate Required Inputs ---
@@ -32,17 +69,29 @@ class CreateOrderTool(Tool):
             customer_phone = tool_parameters.get("customer_phone")
             customer_name = tool_parameters.get("customer_name")
 
-            # Debug: Add parameter info
-            response_data["received_parameters"] = {
-                "order_amount": order_amount,
-                "order_currency": order_currency,
-                "customer_id": customer_id,
-                "customer_email": customer_email,
-                "customer_phone": customer_phone,
-                "customer_name": customer_name,
-                "total_params": len(tool_parameters),
-                "all_param_keys": list(tool_parameters.keys())
-            }
+            # Bind optional inputs once; reused by validation and body assembly
+            order_id = tool_parameters.get("order_id")
+            order_note = tool_parameters.get("order_note")
+            order_expiry_time = tool_parameters.get("order_expiry_time")
+            customer_bank_account_number = tool_parameters.get("customer_bank_account_number")
+            customer_bank_ifsc = tool_parameters.get("customer_bank_ifsc")
+            return_url = tool_parameters.get("return_url")
+            notify_url = tool_parameters.get("notify_url")
+            payment_methods = tool_parameters.get("payment_methods")
+
+            # Debug: echo parameter info only when debug logging is enabled,
+            # so the happy path skips the extra dict copy and payload bytes
+            if logger.isEnabledFor(logging.DEBUG):
+                response_data["received_parameters"] = {
+                    "order_amount": order_amount,
+                    "order_currency": order_currency,
+                    "customer_id": customer_id,
+                    "customer_email": customer_email,
+                    "customer_phone": customer_phone,
+                    "customer_name": customer_name,
+                    "total_params": len(tool_parameters),
+                    "all_param_keys": list(tool_parameters.keys())
+                }
             response_data["tool_execution"] = "PARAMETERS_RECEIVED"
 
             # Validate required parameters
@@ -76,45 +125,14 @@ class CreateOrderTool(Tool):
                 yield self.create_json_message(response_data)
                 return
 
-            # Validate order_id format if provided
-            order_id = tool_parameters.get("order_id")
-            if order_id:
-                # Check length (3-45 characters)
-                if not (3 <= len(order_id) <= 45):
-                    response_data["message"] = "Fatal Error: order_id must be between 3 and 45 characters"
+            # Validate optional parameters against the rule table
+            # (value order matches _OPTIONAL_PARAM_RULES)
+            for value, (param_name, predicate, error_msg) in zip(
+                    (order_id, order_note, return_url, notify_url), _OPTIONAL_PARAM_RULES):
+                if value and not predicate(value):
+                    response_data["message"] = error_msg
                     yield self.create_json_message(response_data)
                     return
-                # Check allowed characters (alphanumeric, '_', '-')
-                if not re.match(r'^[a-zA-Z0-9_-]+$', order_id):
-                    response_data["message"] = "Fatal Error: order_id can only contain alphanumeric characters, '_' and '-'"
-                    yield self.create_json_message(response_data)
-                    return
-
-            # Validate order_note length if provided
-            order_note = tool_parameters.get("order_note")
-            if order_note and not (3 <= len(order_note) <= 200):
-                response_data["message"] = "Fatal Error: order_note must be between 3 and 200 characters"
-                yield self.create_json_message(response_data)
-                return
-
-            # Validate URL lengths if provided
-            return_url = tool_parameters.get("return_url")
-            if return_url and len(return_url) > 250:
-                response_data["message"] = "Fatal Error: return_url must not exceed 250 characters"
-                yield self.create_json_message(response_data)
-                return
-
-            notify_url = tool_parameters.get("notify_url")
-            if notify_url and len(notify_url) > 250:
-                response_data["message"] = "Fatal Error: notify_url must not exceed 250 characters"
-                yield self.create_json_message(response_data)
-                return
-
-            # Validate notify_url is HTTPS if provided
-            if notify_url and not notify_url.startswith('https://'):
-                response_data["message"] = "Fatal Error: notify_url must use HTTPS protocol"
-                yield self.create_json_message(response_data)
-                return
 
             # --- 2. Retrieve Credentials ---
             try:
@@ -142,20 +160,22 @@ class CreateOrderTool(Tool):
                 return
 
             # --- 3. Construct API URL and Headers ---
-            base_url = "https://api.cashfree.com/pg" if environment == "production" else "https://sandbox.cashfree.com/pg"
+            base_url = PG_BASE_URLS.get(environment, PG_BASE_URLS["sandbox"])
             api_url = f"{base_url}/orders"
             
             # Get authentication headers from provider
             try:
                 headers = get_auth_headers(credentials, include_api_version=True, is_payout_api=False)
                 headers["Accept"] = "application/json"
-                headers["x-request-id"] = str(uuid.uuid4())
+                headers["x-request-id"] = uuid.uuid4().hex
             except Exception as e:
                 response_data["message"] = f"Fatal Error: Authentication failed: {str(e)}"
                 yield self.create_json_message(response_data)
                 return
 
             # --- 4. Build Request Body ---
+            # Optional keys are merged in-place via conditional unpacking, so
+            # absent values never touch the dict
             request_body = {
                 "order_amount": order_amount,
                 "order_currency": order_currency,
@@ -163,61 +183,60 @@ class CreateOrderTool(Tool):
                     "customer_id": customer_id,
                     "customer_email": customer_email,
                     "customer_phone": customer_phone,
-                    "customer_name": customer_name
-                }
-            }
-
-            # Add optional parameters if provided
-            optional_params = {
-                "order_id": tool_parameters.get("order_id"),
-                "order_note": tool_parameters.get("order_note"),
-                "order_expiry_time": tool_parameters.get("order_expiry_time"),
-                "customer_bank_account_number": tool_parameters.get("customer_bank_account_number"),
-                "customer_bank_ifsc": tool_parameters.get("customer_bank_ifsc")
+                    "customer_name": customer_name,
+                    **({"customer_bank_account_number": customer_bank_account_number} if customer_bank_account_number else {}),
+                    **({"customer_bank_ifsc": customer_bank_ifsc} if customer_bank_ifsc else {})
+                },
+                **({"order_id": order_id} if order_id else {}),
+                **({"order_note": order_note} if order_note else {}),
+                **({"order_expiry_time": order_expiry_time} if order_expiry_time else {})
             }
 
-            # Add optional customer details
-            for key, value in optional_params.items():
-                if value:
-                    if key.startswith("customer_bank_"):
-                        request_body["customer_details"][key] = value
-                    else:
-                        request_body[key] = value
-
             # Add order meta if return_url, notify_url, or payment_methods are provided
             order_meta = {}
-            if tool_parameters.get("return_url"):
-                order_meta["return_url"] = tool_parameters.get("return_url")
-            if tool_parameters.get("notify_url"):
-                order_meta["notify_url"] = tool_parameters.get("notify_url")
-            if tool_parameters.get("payment_methods"):
-                order_meta["payment_methods"] = tool_parameters.get("payment_methods")
+            if return_url:
+                order_meta["return_url"] = return_url
+            if notify_url:
+                order_meta["notify_url"] = notify_url
+            if payment_methods:
+                order_meta["payment_methods"] = payment_methods
             
             if order_meta:
                 request_body["order_meta"] = order_meta
 
             # --- 5. Execute API Call (POST request) ---
             try:
-                # Add debugging info
-                response_data["debug_info"] = {
-                    "api_url": api_url,
-                    "environment": environment,
-                    "auth_method": auth_method,
-                    "request_body_keys": list(request_body.keys()),
-                    "has_credentials": bool(credentials.get("cashfree_client_id") if auth_method == "client_credentials" else credentials.get("bearer_token"))
-                }
-                
-                response = requests.post(api_url, headers=headers, json=request_body, timeout=30)
+                # Add debugging info (debug logging only)
+                if logger.isEnabledFor(logging.DEBUG):
+                    response_data["debug_info"] = {
+                        "api_url": api_url,
+                        "environment": environment,
+                        "auth_method": auth_method,
+                        "request_body_keys": list(request_body.keys()),
+                        "has_credentials": bool(credentials.get("cashfree_client_id") if auth_method == "client_credentials" else credentials.get("bearer_token"))
+                    }
+
+
+                # Content-Type is already set by get_auth_headers; orjson encodes
+                # straight to bytes, skipping the stdlib json encoder
+                response = session.post(api_url, headers=headers, data=orjson.dumps(request_body), timeout=30)
                 
                 # Update base status information
                 response_data["status_code"] = response.status_code
                 response_data["success"] = (response.status_code == 200)
 
-                # Attempt to parse JSON body
-                try:
-                    raw_api_data = response.json()
+                # Only attempt a JSON parse when the server says it sent JSON;
+                # CDN/WAF error pages come back as HTML
+                raw_api_data = None
+                if "json" in response.headers.get("Content-Type", ""):
+                    try:
+                        raw_api_data = orjson.loads(response.content)
+                    except orjson.JSONDecodeError:
+                        raw_api_data = None
+
+                if raw_api_data is not None:
                     response_data["api_response"] = raw_api_data
-                    
+
                     if response_data["success"]:
                         # Extract key information for success response
                         response_data["order_id"] = raw_api_data.get("order_id")
@@ -227,8 +246,7 @@ class CreateOrderTool(Tool):
                         # Handle error response
                         error_message = raw_api_data.get('message', f"API returned error status {response.status_code}")
                         response_data["message"] = f"API Error: {error_message}"
-
-                except json.JSONDecodeError:
+                else:
                     # Handle cases where the server returns a non-JSON body
                     response_data["api_response"] = {"raw_text": response.text}
                     response_data["message"] = f"API returned non-JSON response with status code {response.status_code}. Response: {response.text[:200]}"
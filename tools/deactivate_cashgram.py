@@ -1,26 +1,49 @@
 import requests
-import json
-import uuid
-import re
+import orjson
+import string
 from collections.abc import Generator
 from typing import Any, Dict
 
-from dify_plugin import Tool
-from dify_plugin.entities.tool import ToolInvokeMessage
+from tool_base import CashfreeToolBase, ToolInvokeMessage
 from auth_utils import get_auth_headers
+from http_utils import session
 
-class DeactivateCashgramTool(Tool):
+# cashgramId allows alphanumerics, '_' and '-'; set difference against a
+# frozenset runs in C without the regex engine
+_CASHGRAM_ID_ALLOWED = frozenset(string.ascii_letters + string.digits + '_-')
+
+# 400-level deactivation failures mapped to clearer messages; scanned once
+# against the lowercased API message
+_DEACTIVATE_400_HINTS = (
+    ("already deactivated", "Cashgram '{cashgram_id}' is already deactivated"),
+    ("expired", "Cashgram '{cashgram_id}' has already expired"),
+    ("not found", "Cashgram '{cashgram_id}' not found"),
+    ("claimed", "Cashgram '{cashgram_id}' has already been claimed and cannot be deactivated")
+)
+
+# Non-400 error statuses with a fixed message template
+_DEACTIVATE_STATUS_HINTS = {
+    401: "Authentication failed. Please check your credentials",
+    403: "Access forbidden. Please check your permissions",
+    404: "Cashgram '{cashgram_id}' not found",
+    422: "Cashgram '{cashgram_id}' cannot be deactivated (may have been claimed or expired)"
+}
+
+# Baseline response structure, copied per invocation
+_RESPONSE_TEMPLATE = {
+    "status_code": None,
+    "success": False,
+    "api_response": None,
+    "message": "",
+    "cashgram_id": None,
+    "status": None
+}
+
+class DeactivateCashgramTool(CashfreeToolBase):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         
         # Initialize a consistent response structure
-        response_data: Dict[str, Any] = {
-            "status_code": None,
-            "success": False,
-            "api_response": None,
-            "message": "",
-            "cashgram_id": None,
-            "status": None
-        }
+        response_data: Dict[str, Any] = _RESPONSE_TEMPLATE.copy()
 
         # --- 1. Retrieve & Validate Required Inputs ---
         cashgram_id = tool_parameters.get("cashgramId")
@@ -37,7 +60,7 @@ class DeactivateCashgramTool(Tool):
             yield self.create_json_message(response_data)
             return
         
-        if not re.match(r'^[a-zA-Z0-9_-]+$', cashgram_id):
+        if set(cashgram_id) - _CASHGRAM_ID_ALLOWED:
             response_data["message"] = "Fatal Error: cashgramId can only contain alphanumeric characters, '_' and '-'"
             yield self.create_json_message(response_data)
             return
@@ -46,22 +69,11 @@ class DeactivateCashgramTool(Tool):
         try:
             credentials = self.runtime.credentials
             environment = credentials.get("cashfree_environment", "sandbox")
-            auth_method = credentials.get("auth_method", "client_credentials")
-            
-            # Validate that we have the required credentials for the selected auth method
-            if auth_method == "client_credentials":
-                if not (credentials.get("cashfree_client_id") and credentials.get("cashfree_client_secret")):
-                    response_data["message"] = "Fatal Error: Cashfree client credentials (Client ID/Secret) are missing."
-                    yield self.create_json_message(response_data)
-                    return
-            elif auth_method == "public_key":
-                required_fields = ["cashfree_client_id", "cashfree_client_secret", "cashfree_public_key"]
-                missing_fields = [field for field in required_fields if not credentials.get(field)]
-                if missing_fields:
-                    response_data["message"] = f"Fatal Error: Missing required fields for public key auth: {', '.join(missing_fields)}"
-                    yield self.create_json_message(response_data)
-                    return
-                    
+            credential_error = self.check_credentials(credentials)
+            if credential_error:
+                response_data["message"] = credential_error
+                yield self.create_json_message(response_data)
+                return
         except Exception as e:
             response_data["message"] = f"Fatal Error: Failed to retrieve credentials: {str(e)}"
             yield self.create_json_message(response_data)
@@ -87,17 +99,31 @@ class DeactivateCashgramTool(Tool):
 
         # --- 5. Execute API Call (POST request) ---
         try:
-            response = requests.post(api_url, headers=headers, json=request_body, timeout=30)
+            response = session.post(api_url, headers=headers, data=orjson.dumps(request_body), timeout=30)
             
             # Update base status information
             response_data["status_code"] = response.status_code
             response_data["success"] = (response.status_code == 200)
 
-            # Attempt to parse JSON body
-            try:
-                raw_api_data = response.json()
+            # Empty bodies (204s, some gateway errors) skip the JSON parse
+            # rather than paying for the decode-exception path
+            if not response.content:
+                response_data["message"] = f"API returned status {response.status_code} with no body"
+                yield self.create_json_message(response_data)
+                return
+
+            # Only parse when the server says it sent JSON; gateway/WAF
+            # errors often come back as HTML or plain text
+            raw_api_data = None
+            if "json" in response.headers.get("Content-Type", ""):
+                try:
+                    raw_api_data = orjson.loads(response.content)
+                except orjson.JSONDecodeError:
+                    raw_api_data = None
+
+            if raw_api_data is not None:
                 response_data["api_response"] = raw_api_data
-                
+
                 if response_data["success"]:
                     # Extract key information for success response
                     response_data["cashgram_id"] = raw_api_data.get("cashgramId")
@@ -107,31 +133,26 @@ class DeactivateCashgramTool(Tool):
                     # Handle error response
                     error_message = raw_api_data.get('message', f"API returned error status {response.status_code}")
                     
-                    # Check for common deactivation errors
+                    # Check for common deactivation errors; lowercase once,
+                    # walk the 400 hint table at most once, and resolve the
+                    # other statuses with a single dict lookup
                     if response.status_code == 400:
-                        if "already deactivated" in error_message.lower():
-                            response_data["message"] = f"Cashgram '{cashgram_id}' is already deactivated"
-                        elif "expired" in error_message.lower():
-                            response_data["message"] = f"Cashgram '{cashgram_id}' has already expired"
-                        elif "not found" in error_message.lower():
-                            response_data["message"] = f"Cashgram '{cashgram_id}' not found"
-                        elif "claimed" in error_message.lower():
-                            response_data["message"] = f"Cashgram '{cashgram_id}' has already been claimed and cannot be deactivated"
+                        err_lower = error_message.lower()
+                        for needle, template in _DEACTIVATE_400_HINTS:
+                            if needle in err_lower:
+                                response_data["message"] = template.format(cashgram_id=cashgram_id)
+                                break
                         else:
                             response_data["message"] = f"Cannot deactivate Cashgram: {error_message}"
-                    elif response.status_code == 401:
-                        response_data["message"] = "Authentication failed. Please check your credentials"
-                    elif response.status_code == 403:
-                        response_data["message"] = "Access forbidden. Please check your permissions"
-                    elif response.status_code == 404:
-                        response_data["message"] = f"Cashgram '{cashgram_id}' not found"
-                    elif response.status_code == 422:
-                        response_data["message"] = f"Cashgram '{cashgram_id}' cannot be deactivated (may have been claimed or expired)"
                     else:
-                        response_data["message"] = error_message
+                        hint = _DEACTIVATE_STATUS_HINTS.get(response.status_code)
+                        if hint is not None:
+                            response_data["message"] = hint.format(cashgram_id=cashgram_id)
+                        else:
+                            response_data["message"] = error_message
 
-            except json.JSONDecodeError:
-                # Handle cases where the server returns a non-JSON body
+            else:
+                # Non-JSON body (e.g., plain text 500 error)
                 response_data["api_response"] = {"raw_text": response.text}
                 response_data["message"] = f"API returned non-JSON response with status code {response.status_code}."
             
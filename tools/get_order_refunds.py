@@ -1,34 +1,40 @@
 import requests
-import json
-import uuid
+import orjson
+import math
 from collections.abc import Generator
 from typing import Any, Dict
 
-from dify_plugin import Tool
-from dify_plugin.entities.tool import ToolInvokeMessage
-from auth_utils import get_auth_headers
+from tool_base import CashfreeToolBase, ToolInvokeMessage
+from http_utils import session
 
-class GetOrderRefundsTool(Tool):
+# Baseline response structure, copied per invocation
+_RESPONSE_TEMPLATE = {
+    "status_code": None,
+    "success": False,
+    "api_response": None,
+    "message": "",
+    "order_id": None,
+    "refunds_count": 0,
+    "total_refunded_amount": 0.0,
+    "refunds": []
+}
+
+class GetOrderRefundsTool(CashfreeToolBase):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        # Single yield site; _build exits early with plain returns, which are
+        # cheaper than extra generator suspensions
+        yield self.create_json_message(self._build(tool_parameters))
+
+    def _build(self, tool_parameters: dict[str, Any]) -> Dict[str, Any]:
         
         # Initialize a consistent response structure
-        response_data: Dict[str, Any] = {
-            "status_code": None,
-            "success": False,
-            "api_response": None,
-            "message": "",
-            "order_id": None,
-            "refunds_count": 0,
-            "total_refunded_amount": 0.0,
-            "refunds": []
-        }
+        response_data: Dict[str, Any] = _RESPONSE_TEMPLATE.copy()
 
         # --- 1. Retrieve & Validate Required Input (Order ID) ---
         order_id = tool_parameters.get("order_id")
         if not order_id:
             response_data["message"] = "Fatal Error: order_id is required but was not provided."
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # Store the order_id for response
         response_data["order_id"] = order_id
@@ -36,99 +42,87 @@ class GetOrderRefundsTool(Tool):
         # --- 2. Retrieve Credentials ---
         try:
             credentials = self.runtime.credentials
-            environment = credentials.get("cashfree_environment", "sandbox")
-            auth_method = credentials.get("auth_method", "client_credentials")
-            
-            # Validate that we have the required credentials for the selected auth method
-            if auth_method == "client_credentials":
-                if not (credentials.get("cashfree_client_id") and credentials.get("cashfree_client_secret")):
-                    response_data["message"] = "Fatal Error: Cashfree client credentials (Client ID/Secret) are missing."
-                    yield self.create_json_message(response_data)
-                    return
-            elif auth_method == "public_key":
-                required_fields = ["cashfree_client_id", "cashfree_client_secret", "cashfree_public_key"]
-                missing_fields = [field for field in required_fields if not credentials.get(field)]
-                if missing_fields:
-                    response_data["message"] = f"Fatal Error: Missing required fields for public key auth: {', '.join(missing_fields)}"
-                    yield self.create_json_message(response_data)
-                    return
-                    
+            credential_error = self.check_credentials(credentials)
+            if credential_error:
+                response_data["message"] = credential_error
+                return response_data
         except Exception as e:
             response_data["message"] = f"Fatal Error: Failed to retrieve credentials: {str(e)}"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
 
         # --- 3. Construct API URL and Headers ---
-        base_url = "https://api.cashfree.com/pg" if environment == "production" else "https://sandbox.cashfree.com/pg"
-        api_url = f"{base_url}/orders/{order_id}/refunds"
-                
-        # Get authentication headers from provider
+        # pg_request_context caches the base URL and header template per
+        # credential set; only the request id is minted per call
         try:
-            headers = get_auth_headers(credentials, include_api_version=True, is_payout_api=False)
-            headers["Accept"] = "application/json"
-            headers["x-request-id"] = str(uuid.uuid4())
+            base_url, headers = self.pg_request_context(credentials)
         except Exception as e:
             response_data["message"] = f"Fatal Error: Authentication failed: {str(e)}"
-            yield self.create_json_message(response_data)
-            return
+            return response_data
+
+        api_url = f"{base_url}/orders/{order_id}/refunds"
 
         # --- 4. Execute API Call (GET request) ---
+        # One flat try around the request and the JSON parse; each failure
+        # mode gets its own handler instead of a nested try block
         try:
-            response = requests.get(api_url, headers=headers, timeout=30)
-            
-            # Update base status information
+            response = session.get(api_url, headers=headers, timeout=30)
+
+            # Update base status information (any 2xx counts as success)
+            is_ok = 200 <= response.status_code < 300
             response_data["status_code"] = response.status_code
-            response_data["success"] = (response.status_code == 200)
-
-            # Attempt to parse JSON body, even if the status code is an error
-            try:
-                raw_api_data = response.json()
-                response_data["api_response"] = raw_api_data
-                
-                # Set a friendly message based on Cashfree's status/error messages
-                if response_data["success"]:
-                    # Extract refund information for success response
-                    refunds = raw_api_data if isinstance(raw_api_data, list) else raw_api_data.get('refunds', [])
-                    response_data["refunds"] = refunds
-                    response_data["refunds_count"] = len(refunds)
-                    
-                    # Calculate total refunded amount
-                    total_refunded = 0.0
-                    for refund in refunds:
-                        refund_amount = refund.get('refund_amount', 0)
-                        if isinstance(refund_amount, (int, float)):
-                            total_refunded += float(refund_amount)
-                    
-                    response_data["total_refunded_amount"] = total_refunded
-                    
-                    if response_data["refunds_count"] > 0:
-                        response_data["message"] = f"Retrieved {response_data['refunds_count']} refund(s) for order {order_id}. Total refunded amount: ₹{total_refunded:.2f}"
-                    else:
-                        response_data["message"] = f"No refunds found for order {order_id}"
-                else:
-                    # Handle specific error cases
-                    error_message = raw_api_data.get('message', f"API returned error status {response.status_code}")
-                    
-                    # Provide more context for common error scenarios
-                    if response.status_code == 404:
-                        response_data["message"] = f"Order not found: {order_id}. Please verify the order_id."
-                    elif response.status_code == 400:
-                        response_data["message"] = f"Bad Request: {error_message}. Please check the order_id format."
-                    else:
-                        response_data["message"] = error_message
-
-            except json.JSONDecodeError:
-                # Handle cases where the server returns a non-JSON body (e.g., plain text 500 error)
-                response_data["api_response"] = {"raw_text": response.text}
-                response_data["message"] = f"API returned non-JSON response with status code {response.status_code}."
-            
-            # 5. Yield the final, standardized JSON message
-            yield self.create_json_message(response_data)
+            response_data["success"] = is_ok
+
+            # Empty bodies (204s, some gateway errors) skip the JSON parse
+            # rather than paying for the decode-exception path
+            if not response.content:
+                response_data["message"] = f"API returned status {response.status_code} with no body"
+                return response_data
 
+            raw_api_data = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            # The server returned a non-JSON body (e.g. plain text 500 error)
+            response_data["api_response"] = {"raw_text": response.text}
+            response_data["message"] = f"API returned non-JSON response with status code {response.status_code}."
+            return response_data
         except requests.exceptions.RequestException as e:
-            # Handle connection or timeout errors (no response received from server)
-            response_data["status_code"] = 0 
+            # Connection or timeout errors (no response received from server)
+            response_data["status_code"] = 0
             response_data["success"] = False
             response_data["message"] = f"Network Error: Could not connect to API within timeout. Details: {str(e)}"
-            
-            yield self.create_json_message(response_data)
+            return response_data
+
+        response_data["api_response"] = raw_api_data
+
+        # Set a friendly message based on Cashfree's status/error messages
+        if is_ok:
+            # Extract refund information for success response
+            refunds = raw_api_data if isinstance(raw_api_data, list) else raw_api_data.get('refunds', [])
+            response_data["refunds"] = refunds
+            response_data["refunds_count"] = len(refunds)
+
+            # Calculate total refunded amount in a single C-level
+            # reduction; fsum also avoids FP summation drift
+            total_refunded = math.fsum(
+                amount for refund in refunds
+                if isinstance(amount := refund.get('refund_amount', 0), (int, float))
+            )
+
+            response_data["total_refunded_amount"] = total_refunded
+
+            if response_data["refunds_count"] > 0:
+                response_data["message"] = f"Retrieved {response_data['refunds_count']} refund(s) for order {order_id}. Total refunded amount: ₹{total_refunded:.2f}"
+            else:
+                response_data["message"] = f"No refunds found for order {order_id}"
+        else:
+            # Handle specific error cases
+            error_message = raw_api_data.get('message', f"API returned error status {response.status_code}")
+
+            # Provide more context for common error scenarios
+            if response.status_code == 404:
+                response_data["message"] = f"Order not found: {order_id}. Please verify the order_id."
+            elif response.status_code == 400:
+                response_data["message"] = f"Bad Request: {error_message}. Please check the order_id format."
+            else:
+                response_data["message"] = error_message
+
+        return response_data
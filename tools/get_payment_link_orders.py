@@ -1,26 +1,27 @@
 import requests
-import json
-import uuid
+import orjson
 from collections.abc import Generator
 from typing import Any, Dict
 
-from dify_plugin import Tool
-from dify_plugin.entities.tool import ToolInvokeMessage
-from auth_utils import get_auth_headers
+from tool_base import CashfreeToolBase, ToolInvokeMessage
+from http_utils import session
 
-class GetPaymentLinkOrdersTool(Tool):
+# Baseline response structure, copied per invocation
+_RESPONSE_TEMPLATE = {
+    "status_code": None,
+    "success": False,
+    "api_response": None,
+    "message": "",
+    "link_id": None,
+    "orders_count": 0,
+    "orders": []
+}
+
+class GetPaymentLinkOrdersTool(CashfreeToolBase):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
         
         # Initialize a consistent response structure
-        response_data: Dict[str, Any] = {
-            "status_code": None,
-            "success": False,
-            "api_response": None,
-            "message": "",
-            "link_id": None,
-            "orders_count": 0,
-            "orders": []
-        }
+        response_data: Dict[str, Any] = _RESPONSE_TEMPLATE.copy()
 
         # --- 1. Retrieve & Validate Required Input (Link ID) ---
         link_id = tool_parameters.get("link_id")
@@ -42,59 +43,59 @@ class GetPaymentLinkOrdersTool(Tool):
         # --- 2. Retrieve Credentials ---
         try:
             credentials = self.runtime.credentials
-            environment = credentials.get("cashfree_environment", "sandbox")
-            auth_method = credentials.get("auth_method", "client_credentials")
-            
-            # Validate that we have the required credentials for the selected auth method
-            if auth_method == "client_credentials":
-                if not (credentials.get("cashfree_client_id") and credentials.get("cashfree_client_secret")):
-                    response_data["message"] = "Fatal Error: Cashfree client credentials (Client ID/Secret) are missing."
-                    yield self.create_json_message(response_data)
-                    return
-            elif auth_method == "public_key":
-                required_fields = ["cashfree_client_id", "cashfree_client_secret", "cashfree_public_key"]
-                missing_fields = [field for field in required_fields if not credentials.get(field)]
-                if missing_fields:
-                    response_data["message"] = f"Fatal Error: Missing required fields for public key auth: {', '.join(missing_fields)}"
-                    yield self.create_json_message(response_data)
-                    return
-                    
+            credential_error = self.check_credentials(credentials)
+            if credential_error:
+                response_data["message"] = credential_error
+                yield self.create_json_message(response_data)
+                return
         except Exception as e:
             response_data["message"] = f"Fatal Error: Failed to retrieve credentials: {str(e)}"
             yield self.create_json_message(response_data)
             return
 
         # --- 3. Construct API URL and Headers ---
-        base_url = "https://api.cashfree.com/pg" if environment == "production" else "https://sandbox.cashfree.com/pg"
-        api_url = f"{base_url}/links/{link_id}/orders"
-        
-        # Add query parameter if status is provided
-        if status:
-            api_url += f"?status={status}"
-                
-        # Get authentication headers from provider
+        # pg_request_context caches the base URL and header template per
+        # credential set; only the request id is minted per call
         try:
-            headers = get_auth_headers(credentials, include_api_version=True, is_payout_api=False)
-            headers["Accept"] = "application/json"
-            headers["x-request-id"] = str(uuid.uuid4())
+            base_url, headers = self.pg_request_context(credentials)
         except Exception as e:
             response_data["message"] = f"Fatal Error: Authentication failed: {str(e)}"
             yield self.create_json_message(response_data)
             return
 
+        api_url = f"{base_url}/links/{link_id}/orders"
+
+        # Let requests urlencode the status filter instead of concatenating
+        # it into the URL by hand
+        params = {"status": status} if status else None
+
         # --- 4. Execute API Call (GET request) ---
         try:
-            response = requests.get(api_url, headers=headers, timeout=30)
+            response = session.get(api_url, headers=headers, params=params, timeout=30)
             
             # Update base status information
             response_data["status_code"] = response.status_code
             response_data["success"] = (response.status_code == 200)
 
-            # Attempt to parse JSON body, even if the status code is an error
-            try:
-                raw_api_data = response.json()
+            # Empty bodies (204s, some gateway errors) skip the JSON parse
+            # rather than paying for the decode-exception path
+            if not response.content:
+                response_data["message"] = f"API returned status {response.status_code} with no body"
+                yield self.create_json_message(response_data)
+                return
+
+            # Only parse when the server says it sent JSON; gateway/WAF
+            # errors often come back as HTML or plain text
+            raw_api_data = None
+            if "json" in response.headers.get("Content-Type", ""):
+                try:
+                    raw_api_data = orjson.loads(response.content)
+                except orjson.JSONDecodeError:
+                    raw_api_data = None
+
+            if raw_api_data is not None:
                 response_data["api_response"] = raw_api_data
-                
+
                 # Set a friendly message based on Cashfree's status/error messages
                 if response_data["success"]:
                     # Extract order information for success response
@@ -118,8 +119,8 @@ class GetPaymentLinkOrdersTool(Tool):
                     else:
                         response_data["message"] = error_message
 
-            except json.JSONDecodeError:
-                # Handle cases where the server returns a non-JSON body (e.g., plain text 500 error)
+            else:
+                # Non-JSON body (e.g., plain text 500 error)
                 response_data["api_response"] = {"raw_text": response.text}
                 response_data["message"] = f"API returned non-JSON response with status code {response.status_code}."
             